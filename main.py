@@ -5,6 +5,8 @@ import yaml
 import logging
 from src.database import DatabaseHandler
 import src.file_handler as fh
+import src.integrity as integrity
+import src.planner as planner
 import src.logger as logger
 
 def load_config():
@@ -22,11 +24,35 @@ def load_config():
         print(f"Error loading config.yaml: {e}")
         return None
 
+def print_plan(title, plan, limit=20):
+    """Prints the summary and the first few actions of a dry-run plan."""
+    summary = plan['summary']
+    print(f"\n--- {title} ---")
+    print(f"  Files: {summary['files']} | Bytes: {summary['bytes']}")
+    if summary['same_device_files'] or summary['cross_device_files']:
+        print(f"  Same-device moves: {summary['same_device_files']} ({summary['same_device_bytes']} bytes)")
+        print(f"  Cross-device moves: {summary['cross_device_files']} ({summary['cross_device_bytes']} bytes)")
+    print(f"  Estimated duration: {summary['estimated_seconds']:.1f}s", end="")
+    if summary['unestimated_files']:
+        print(f" (plus {summary['unestimated_files']} files with no measured throughput yet)")
+    else:
+        print()
+    for action in plan['actions'][:limit]:
+        destination = f" -> {action['destination']}" if 'destination' in action else ""
+        print(f"  {action['action']}: {action['source']}{destination} ({action['size']} bytes)")
+    if len(plan['actions']) > limit:
+        print(f"  ... and {len(plan['actions']) - limit} more")
+
 def main():
     """Main function to run the file archiver application."""
     config = load_config()
     if not config:
         return
+    try:
+        fh.validate_archive_layout(config)
+    except ValueError as e:
+        print(f"Error in config.yaml: {e}")
+        return
 
     # Set up logging
     logger.setup_logger(config['log_file'])
@@ -42,6 +68,7 @@ def main():
         
         # Ensure the database table is set up
         db_handler.setup_table()
+        fh.backfill_storage_details(db_handler, config)
 
         # --- Main Application Loop ---
         exit_loop = False
@@ -52,6 +79,9 @@ def main():
             print("3. List currently archived files")
             print("4. Restore an archived file")
             print("5. Force delete an archived file")
+            print("6. Verify archive integrity")
+            print("7. Show archive space report")
+            print("8. Plan archive and purge (dry run)")
             print("0. Exit")
             
             entry = input("==> ")
@@ -78,6 +108,43 @@ def main():
             elif entry == "5":
                 file_id = input("Enter the ID of the file to delete: ")
                 fh.delete_archived_file(db_handler, config, file_id)
+            elif entry == "6":
+                logging.info("Starting archive integrity verification...")
+                report = integrity.verify_archive(db_handler, config)
+                print("\n--- Integrity Report ---")
+                print(f"  Verified: {report['verified']} | Unchanged (skipped): {report['skipped']} | Baselined: {report['baselined']}")
+                for file_id, path in report['corrupted']:
+                    print(f"  CORRUPTED  ID: {file_id} | Path: {path}")
+                for file_id, path in report['missing']:
+                    print(f"  MISSING    ID: {file_id} | Path: {path}")
+                for file_id, path in report['unreadable']:
+                    print(f"  UNREADABLE ID: {file_id} | Path: {path}")
+                for path in report['orphaned']:
+                    print(f"  ORPHANED   Path: {path}")
+                print("------------------------")
+            elif entry == "7":
+                print("\n--- Space by Status ---")
+                for status, count, total_bytes in db_handler.get_bytes_by_status():
+                    print(f"  {status}: {count} files, {total_bytes} bytes")
+                print("--- Archived Space by Scan Directory ---")
+                for scan_root, count, total_bytes in db_handler.get_bytes_by_scan_root():
+                    print(f"  {scan_root or 'unknown'}: {count} files, {total_bytes} bytes")
+                print("--- Archived Space by Month ---")
+                for month, count, total_bytes in db_handler.get_bytes_by_archive_month():
+                    print(f"  {month or 'unknown'}: {count} files, {total_bytes} bytes")
+                print("---------------------------------------")
+            elif entry == "8":
+                logging.info("Planning archive and purge (dry run)...")
+                archive_plan = planner.plan_archive(db_handler, config)
+                purge_plan = planner.plan_purge(db_handler, config)
+                print_plan("Planned Archive", archive_plan)
+                print_plan("Planned Purge", purge_plan)
+                if archive_plan['actions'] or purge_plan['actions']:
+                    if input("Execute this plan? [y/N] ").strip().lower() == "y":
+                        planner.execute_archive_plan(db_handler, config, archive_plan)
+                        planner.execute_purge_plan(db_handler, config, purge_plan)
+                    else:
+                        print("Plan discarded. Nothing was changed.")
             elif entry == "0":
                 exit_loop = True
             else:
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+import os
+import yaml
+import logging
+import sys
+from src.database import DatabaseHandler
+from src.file_handler import backfill_storage_details, reshard_archive, validate_archive_layout
+
+def setup_console_logger():
+    """Sets up a simple logger to print messages to the console."""
+    logger = logging.getLogger()
+    logger.setLevel(logging.INFO)
+    if not logger.hasHandlers():
+        handler = logging.StreamHandler(sys.stdout)
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+
+def load_config():
+    """Loads the configuration from config.yaml."""
+    basedir = os.path.abspath(os.path.dirname(__file__))
+    config_path = os.path.join(basedir, 'config.yaml')
+    try:
+        with open(config_path, 'r') as f:
+            return yaml.safe_load(f)
+    except FileNotFoundError:
+        logging.error("FATAL: config.yaml not found. Please ensure it exists in the project root.")
+        return None
+    except Exception as e:
+        logging.error(f"FATAL: Error loading or parsing config.yaml: {e}")
+        return None
+
+def main():
+    """
+    Moves every archived file into the layout configured by 'archive_layout',
+    'shard_depth' and 'shard_width' in config.yaml. Safe to re-run.
+    """
+    setup_console_logger()
+
+    config = load_config()
+    if not config:
+        return # Exit if config loading failed
+    try:
+        validate_archive_layout(config)
+    except ValueError as e:
+        logging.error(f"FATAL: Error in config.yaml: {e}")
+        return
+
+    db_handler = DatabaseHandler(config['database_name'])
+
+    try:
+        if not db_handler.connect():
+            logging.critical("Could not connect to the database. Aborting reshard.")
+            return
+
+        # Make sure older databases have the stored_path column
+        db_handler.setup_table()
+        backfill_storage_details(db_handler, config)
+
+        logging.info(f"Resharding archive into the '{config.get('archive_layout', 'flat')}' layout...")
+        reshard_archive(db_handler, config)
+
+    except Exception as e:
+        logging.critical(f"An unexpected error occurred during the reshard: {e}", exc_info=True)
+    finally:
+        logging.info("Closing database connection.")
+        db_handler.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+
+import asyncio
+import logging
+from main import load_config
+from src.file_handler import validate_archive_layout
+from src.service import run_service
+import src.logger as logger
+
+def main():
+    """Runs the archive query/control service until interrupted."""
+    config = load_config()
+    if not config:
+        return
+    try:
+        validate_archive_layout(config)
+    except ValueError as e:
+        print(f"Error in config.yaml: {e}")
+        return
+
+    logger.setup_logger(config['log_file'])
+    logging.info("Archive service starting...")
+
+    try:
+        asyncio.run(run_service(config))
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        logging.critical(f"Archive service stopped unexpectedly: {e}", exc_info=True)
+    finally:
+        logging.info("Archive service finished.")
+
+
+if __name__ == "__main__":
+    main()
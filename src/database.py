@@ -1,10 +1,36 @@
+import os
 import sqlite3
 import logging
+from contextlib import contextmanager
 from datetime import datetime
+from urllib.request import pathname2url
 
 # Configure basic logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Columns added to the 'archive' table after its first release, in the order
+# they are appended. Existing databases are migrated by setup_table().
+ARCHIVE_MIGRATION_COLUMNS = [
+    ('stored_path', 'TEXT'),
+    ('original_size', 'INTEGER'),
+    ('original_mtime', 'TEXT'),
+    ('scan_root', 'TEXT'),
+    ('storage_device', 'INTEGER'),
+]
+
+# Indexes that let the reporting queries be answered from the index alone.
+# The month index also holds date_archived itself, since SQLite only treats an
+# expression index as covering when the columns it reads are in the index.
+ARCHIVE_INDEXES = {
+    'idx_archive_status_root_size': 'archive (status, scan_root, original_size)',
+    'idx_archive_status_month_size_date': 'archive (status, substr(date_archived, 1, 7), original_size, date_archived)',
+    # Used to check whether a path in the archive already belongs to a record.
+    'idx_archive_stored_path': 'archive (stored_path)',
+}
+
+# Indexes created by earlier versions that have since been replaced.
+OBSOLETE_INDEXES = ['idx_archive_status_month_size']
+
 class DatabaseHandler:
     """
     A class to handle all interactions with the SQLite database.
@@ -18,14 +44,45 @@ class DatabaseHandler:
         self.db_path = db_path
         self.conn = None
         self.cursor = None
+        self._in_transaction = False
 
-    def connect(self):
+    def _commit(self):
+        """Commits the current changes, unless they are part of a larger transaction."""
+        if not self._in_transaction:
+            self.conn.commit()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Groups the writes made inside the block into a single commit.
+        The changes are rolled back if the block raises.
+        """
+        if self._in_transaction:
+            yield
+            return
+        self._in_transaction = True
+        try:
+            yield
+        except Exception:
+            self._in_transaction = False
+            self.conn.rollback()
+            raise
+        self._in_transaction = False
+        self.conn.commit()
+
+    def connect(self, read_only=False):
         """
         Establishes a connection to the database and creates a cursor.
+        A read-only connection may be used from any thread, as long as only
+        one thread uses it at a time.
         Returns True on success, False on failure.
         """
         try:
-            self.conn = sqlite3.connect(self.db_path)
+            if read_only:
+                uri = f"file:{pathname2url(os.path.abspath(self.db_path))}?mode=ro"
+                self.conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            else:
+                self.conn = sqlite3.connect(self.db_path)
             self.cursor = self.conn.cursor()
             logging.info(f"Successfully connected to database at {self.db_path}")
             return True
@@ -39,9 +96,22 @@ class DatabaseHandler:
             self.conn.close()
             logging.info("Database connection closed.")
 
+    def enable_wal_mode(self):
+        """
+        Switches the database to write-ahead logging so readers on other
+        connections are not blocked while files are being archived.
+        """
+        try:
+            self.cursor.execute("PRAGMA journal_mode=WAL")
+            return self.cursor.fetchone()[0] == 'wal'
+        except sqlite3.Error as e:
+            logging.error(f"Failed to enable WAL mode: {e}")
+            return False
+
     def setup_table(self):
         """
-        Creates the 'archive' table if it doesn't already exist.
+        Creates the 'archive' table if it doesn't already exist and migrates
+        tables created by older versions to the current schema.
         This should be run once after connecting.
         """
         if not self.cursor:
@@ -53,7 +123,37 @@ class DatabaseHandler:
                     id INTEGER PRIMARY KEY,
                     file_path TEXT NOT NULL UNIQUE,
                     status TEXT DEFAULT 'active' CHECK(status IN ('active', 'archived', 'restored')),
-                    date_archived TEXT
+                    date_archived TEXT,
+                    stored_path TEXT,
+                    original_size INTEGER,
+                    original_mtime TEXT,
+                    scan_root TEXT,
+                    storage_device INTEGER
+                )
+            ''')
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS throughput (
+                    operation TEXT PRIMARY KEY,
+                    files INTEGER NOT NULL,
+                    bytes INTEGER NOT NULL,
+                    seconds REAL NOT NULL
+                )
+            ''')
+            self._migrate_archive_table()
+            self._normalize_file_paths()
+            for name in OBSOLETE_INDEXES:
+                self.cursor.execute(f"DROP INDEX IF EXISTS {name}")
+            for name, definition in ARCHIVE_INDEXES.items():
+                self.cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}")
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS integrity (
+                    file_id INTEGER PRIMARY KEY,
+                    checksum TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    verified_size INTEGER,
+                    verified_mtime_ns INTEGER,
+                    verified_ctime_ns INTEGER,
+                    last_verified TEXT
                 )
             ''')
             self.conn.commit()
@@ -61,12 +161,34 @@ class DatabaseHandler:
         except sqlite3.Error as e:
             logging.error(f"Error setting up table: {e}")
 
+    def _migrate_archive_table(self):
+        """Adds any columns missing from an 'archive' table created by an older version."""
+        self.cursor.execute("PRAGMA table_info(archive)")
+        existing_columns = {row[1] for row in self.cursor.fetchall()}
+        for column, column_type in ARCHIVE_MIGRATION_COLUMNS:
+            if column not in existing_columns:
+                self.cursor.execute(f"ALTER TABLE archive ADD COLUMN {column} {column_type}")
+                logging.info(f"Migrated 'archive' table: added column '{column}'.")
+
+    def _normalize_file_paths(self):
+        """
+        Makes relative file paths stored by older versions absolute. They were
+        always resolved against the working directory, so they are resolved
+        the same way here. A path whose absolute form is already tracked is left as is.
+        """
+        self.cursor.execute("SELECT id, file_path FROM archive WHERE substr(file_path, 1, 1) != '/'")
+        for file_id, file_path in self.cursor.fetchall():
+            try:
+                self.cursor.execute("UPDATE archive SET file_path = ? WHERE id = ?", (os.path.abspath(file_path), file_id))
+            except sqlite3.IntegrityError:
+                logging.warning(f"Could not make path of file ID {file_id} absolute, it is already tracked: {file_path}")
+
     def add_file_record(self, file_path, status, date_archived=None):
         """Adds a new file record to the archive table."""
         query = "INSERT INTO archive (file_path, status, date_archived) VALUES (?, ?, ?)"
         try:
             self.cursor.execute(query, (file_path, status, date_archived))
-            self.conn.commit()
+            self._commit()
             logging.info(f"Added record for: {file_path}")
             return self.cursor.lastrowid
         except sqlite3.Error as e:
@@ -82,21 +204,78 @@ class DatabaseHandler:
         if new_status == 'archived':
             query = "UPDATE archive SET status = ?, date_archived = ? WHERE id = ?"
             params = (new_status, datetime.now().isoformat(), file_id)
-        else: # For restoring, we clear the archive date
-            query = "UPDATE archive SET status = ?, date_archived = NULL WHERE id = ?"
+        else: # For restoring, we clear the archive date and stored location
+            query = "UPDATE archive SET status = ?, date_archived = NULL, stored_path = NULL, storage_device = NULL WHERE id = ?"
         
         try:
             self.cursor.execute(query, params)
-            self.conn.commit()
+            self._commit()
             logging.info(f"Updated status for file ID {file_id} to '{new_status}'")
         except sqlite3.Error as e:
             logging.error(f"Failed to update status for file ID {file_id}: {e}")
 
-    def get_files_by_status(self, status):
-        """Retrieves all records with a specific status."""
-        query = "SELECT * FROM archive WHERE status = ?"
+    def record_storage_details(self, file_id, stored_path, original_size, original_mtime, scan_root, storage_device):
+        """
+        Saves where an archived file is stored and what it looked like before archiving.
+        :param original_mtime: The file's modification time before it was archived, as an ISO string.
+        :param storage_device: The device ID (st_dev) of the filesystem holding the stored file.
+        """
+        query = """
+            UPDATE archive
+            SET stored_path = ?, original_size = ?, original_mtime = ?, scan_root = ?, storage_device = ?
+            WHERE id = ?
+        """
+        try:
+            self.cursor.execute(query, (stored_path, original_size, original_mtime, scan_root, storage_device, file_id))
+            self._commit()
+        except sqlite3.Error as e:
+            logging.error(f"Failed to record storage details for file ID {file_id}: {e}")
+
+    def get_records_without_storage_details(self):
+        """
+        Retrieves (id, file_path) of archived records that have no stored path,
+        i.e. files archived before storage details were tracked.
+        """
+        query = "SELECT id, file_path FROM archive WHERE status = 'archived' AND stored_path IS NULL ORDER BY id"
+        try:
+            self.cursor.execute(query)
+            return self.cursor.fetchall()
+        except sqlite3.Error as e:
+            logging.error(f"Failed to get records without storage details: {e}")
+            return []
+
+    def update_stored_paths(self, entries):
+        """
+        Updates the stored path of several archived files in one transaction.
+        :param entries: An iterable of (file_id, stored_path) tuples.
+        """
+        query = "UPDATE archive SET stored_path = ? WHERE id = ?"
+        params = [(stored_path, file_id) for file_id, stored_path in entries]
+        try:
+            self.cursor.executemany(query, params)
+            self._commit()
+            logging.info(f"Updated stored paths for {len(params)} files")
+        except sqlite3.Error as e:
+            logging.error(f"Failed to update stored paths: {e}")
+
+    def get_ids_by_stored_path(self, stored_path):
+        """Returns the IDs of archived records whose stored path is the given path."""
+        query = "SELECT id FROM archive WHERE stored_path = ? AND status = 'archived'"
+        try:
+            self.cursor.execute(query, (stored_path,))
+            return [row[0] for row in self.cursor.fetchall()]
+        except sqlite3.Error as e:
+            logging.error(f"Failed to get records stored at {stored_path}: {e}")
+            return []
+
+    def get_files_by_status(self, status, limit=None, after_id=0):
+        """
+        Retrieves records with a specific status in ID order.
+        Pass a limit and the last ID already seen as `after_id` to page through them.
+        """
+        query = "SELECT * FROM archive WHERE status = ? AND id > ? ORDER BY id LIMIT ?"
         try:
-            self.cursor.execute(query, (status,))
+            self.cursor.execute(query, (status, after_id, -1 if limit is None else limit))
             return self.cursor.fetchall()
         except sqlite3.Error as e:
             logging.error(f"Failed to get files by status '{status}': {e}")
@@ -122,12 +301,162 @@ class DatabaseHandler:
             logging.error(f"Failed to get file by path {file_path}: {e}")
             return None
 
+    def search_files(self, pattern, limit=100):
+        """
+        Retrieves records whose file path contains the given text (case-insensitive for ASCII).
+        SQL wildcards in the pattern are matched literally.
+        """
+        escaped = pattern.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        query = "SELECT * FROM archive WHERE file_path LIKE ? ESCAPE '\\' ORDER BY id LIMIT ?"
+        try:
+            self.cursor.execute(query, (f"%{escaped}%", limit))
+            return self.cursor.fetchall()
+        except sqlite3.Error as e:
+            logging.error(f"Failed to search files for '{pattern}': {e}")
+            return []
+
     def remove_file_record(self, file_id):
         """Deletes a record from the archive table."""
         query = "DELETE FROM archive WHERE id = ?"
         try:
             self.cursor.execute(query, (file_id,))
-            self.conn.commit()
+            self.cursor.execute("DELETE FROM integrity WHERE file_id = ?", (file_id,))
+            self._commit()
             logging.info(f"Removed record for file ID {file_id}")
         except sqlite3.Error as e:
-            logging.error(f"Failed to remove record for file ID {file_id}: {e}")
\ No newline at end of file
+            logging.error(f"Failed to remove record for file ID {file_id}: {e}")
+
+    def record_checksum(self, file_id, checksum, size, mtime_ns=None, ctime_ns=None):
+        """
+        Stores the reference checksum and size of an archived file.
+        If the file's stat times are given, they are saved as the last verified
+        state so an unchanged file is not re-hashed by the next verification.
+        """
+        query = """
+            INSERT OR REPLACE INTO integrity
+                (file_id, checksum, size, verified_size, verified_mtime_ns, verified_ctime_ns, last_verified)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """
+        verified = mtime_ns is not None
+        params = (
+            file_id, checksum, size,
+            size if verified else None,
+            mtime_ns, ctime_ns,
+            datetime.now().isoformat() if verified else None,
+        )
+        try:
+            self.cursor.execute(query, params)
+            self._commit()
+            logging.info(f"Recorded checksum for file ID {file_id}")
+        except sqlite3.Error as e:
+            logging.error(f"Failed to record checksum for file ID {file_id}: {e}")
+
+    def get_checksum(self, file_id):
+        """Returns the recorded checksum of an archived file, or None if it has none."""
+        query = "SELECT checksum FROM integrity WHERE file_id = ?"
+        try:
+            self.cursor.execute(query, (file_id,))
+            row = self.cursor.fetchone()
+            return row[0] if row else None
+        except sqlite3.Error as e:
+            logging.error(f"Failed to get checksum for file ID {file_id}: {e}")
+            return None
+
+    def record_verifications(self, entries):
+        """
+        Saves the stat state of files that passed verification.
+        :param entries: An iterable of (file_id, size, mtime_ns, ctime_ns) tuples.
+        """
+        query = """
+            UPDATE integrity
+            SET verified_size = ?, verified_mtime_ns = ?, verified_ctime_ns = ?, last_verified = ?
+            WHERE file_id = ?
+        """
+        now = datetime.now().isoformat()
+        params = [(size, mtime_ns, ctime_ns, now, file_id) for file_id, size, mtime_ns, ctime_ns in entries]
+        try:
+            self.cursor.executemany(query, params)
+            self._commit()
+        except sqlite3.Error as e:
+            logging.error(f"Failed to record verification results: {e}")
+
+    def get_archived_integrity(self):
+        """
+        Retrieves every archived file along with its integrity data.
+        Rows are (id, file_path, stored_path, checksum, size, verified_size, verified_mtime_ns, verified_ctime_ns);
+        the integrity columns are NULL for files archived before checksums were recorded.
+        """
+        query = """
+            SELECT a.id, a.file_path, a.stored_path, i.checksum, i.size,
+                   i.verified_size, i.verified_mtime_ns, i.verified_ctime_ns
+            FROM archive a
+            LEFT JOIN integrity i ON i.file_id = a.id
+            WHERE a.status = 'archived'
+        """
+        try:
+            self.cursor.execute(query)
+            return self.cursor.fetchall()
+        except sqlite3.Error as e:
+            logging.error(f"Failed to get integrity records: {e}")
+            return []
+
+    def _aggregate(self, query, params, description):
+        """Runs a reporting query, returning an empty list on failure."""
+        try:
+            self.cursor.execute(query, params)
+            return self.cursor.fetchall()
+        except sqlite3.Error as e:
+            logging.error(f"Failed to get {description}: {e}")
+            return []
+
+    def get_bytes_by_status(self):
+        """Returns (status, file_count, total_bytes) for every status."""
+        query = """
+            SELECT status, COUNT(*), COALESCE(SUM(original_size), 0)
+            FROM archive
+            GROUP BY status
+            ORDER BY status
+        """
+        return self._aggregate(query, (), "bytes by status")
+
+    def get_bytes_by_scan_root(self, status='archived'):
+        """Returns (scan_root, file_count, total_bytes) for files with the given status."""
+        query = """
+            SELECT scan_root, COUNT(*), COALESCE(SUM(original_size), 0)
+            FROM archive
+            WHERE status = ?
+            GROUP BY scan_root
+            ORDER BY scan_root
+        """
+        return self._aggregate(query, (status,), "bytes by scan root")
+
+    def get_bytes_by_archive_month(self):
+        """Returns (YYYY-MM, file_count, total_bytes) for currently archived files."""
+        query = """
+            SELECT substr(date_archived, 1, 7), COUNT(*), COALESCE(SUM(original_size), 0)
+            FROM archive
+            WHERE status = 'archived'
+            GROUP BY substr(date_archived, 1, 7)
+            ORDER BY substr(date_archived, 1, 7)
+        """
+        return self._aggregate(query, (), "bytes by archive month")
+
+    def record_throughput(self, operation, files, total_bytes, seconds):
+        """Adds the files, bytes and time of a finished run to the running totals of an operation."""
+        query = """
+            INSERT INTO throughput (operation, files, bytes, seconds) VALUES (?, ?, ?, ?)
+            ON CONFLICT(operation) DO UPDATE SET
+                files = files + excluded.files,
+                bytes = bytes + excluded.bytes,
+                seconds = seconds + excluded.seconds
+        """
+        try:
+            self.cursor.execute(query, (operation, files, total_bytes, seconds))
+            self._commit()
+        except sqlite3.Error as e:
+            logging.error(f"Failed to record throughput for '{operation}': {e}")
+
+    def get_throughput(self):
+        """Returns a dict mapping each operation to its measured (files, bytes, seconds) totals."""
+        rows = self._aggregate("SELECT operation, files, bytes, seconds FROM throughput", (), "throughput")
+        return {operation: (files, total_bytes, seconds) for operation, files, total_bytes, seconds in rows}
@@ -1,17 +1,179 @@
 import os
+import mmap
+import time
 import shutil
+import hashlib
 import logging
 from datetime import datetime, timedelta
 
-def find_inactive_files(directories, days_inactive):
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def _flat_archive_path(config, original_path):
+    """Returns the location of a file in a flat (unsharded) archive directory."""
+    filename = os.path.basename(original_path)
+    return os.path.join(config['archive_directory'], filename)
+
+def get_shard_directories(config, original_path):
     """
-    Finds files in the given directories that haven't been modified recently.
-    
+    Returns the hash-prefixed subdirectories a file is placed in when the
+    archive uses the 'sharded' layout, or an empty list for the 'flat' layout.
+
+    The SHA-1 of the original path is split into `shard_depth` prefixes of
+    `shard_width` hex characters each, e.g. depth 2 and width 2 gives 'ab/cd'.
+    """
+    layout = config.get('archive_layout', 'flat')
+    if layout == 'flat':
+        return []
+    if layout != 'sharded':
+        raise ValueError(f"Unknown archive_layout '{layout}'. Expected 'flat' or 'sharded'.")
+
+    depth = config.get('shard_depth', 2)
+    width = config.get('shard_width', 2)
+    digest = hashlib.sha1(original_path.encode('utf-8', 'surrogateescape')).hexdigest()
+    if not isinstance(depth, int) or not isinstance(width, int) or depth < 1 or width < 1 or depth * width > len(digest):
+        raise ValueError(f"Invalid shard settings: depth={depth!r}, width={width!r}.")
+    return [digest[i * width:(i + 1) * width] for i in range(depth)]
+
+def validate_archive_layout(config):
+    """
+    Checks the 'archive_layout', 'shard_depth' and 'shard_width' settings.
+    Raises ValueError describing the problem if they are invalid.
+    """
+    get_shard_directories(config, config['archive_directory'])
+
+def get_archive_path(config, original_path):
+    """Returns the location inside the archive directory for an original file path."""
+    filename = os.path.basename(original_path)
+    shards = get_shard_directories(config, original_path)
+    return os.path.join(config['archive_directory'], *shards, filename)
+
+def get_stored_path(config, original_path, stored_path=None):
+    """
+    Returns where an archived file is stored.
+    Records archived before stored paths were tracked were always placed in a
+    flat archive, so they fall back to that location.
+    """
+    return stored_path or _flat_archive_path(config, original_path)
+
+def _is_fallback_match(db_handler, file_id, candidate, original_size):
+    """
+    Checks that a file found at a fallback location really belongs to a record:
+    no other archived record may claim the path, and its size or checksum must
+    match what was recorded when the file was archived.
+    """
+    owners = db_handler.get_ids_by_stored_path(os.path.abspath(candidate))
+    if any(owner != file_id for owner in owners):
+        return False
+    if original_size is not None:
+        return os.path.getsize(candidate) == original_size
+    checksum = db_handler.get_checksum(file_id)
+    return checksum is not None and hash_file(candidate) == checksum
+
+def locate_archived_file(db_handler, config, file_id, original_path, stored_path=None, original_size=None):
+    """
+    Returns where an archived file actually is on disk.
+    The recorded stored path is checked first. If nothing is there, the
+    locations given by the configured layout and by the flat layout are
+    tried, which covers files moved by a reshard that hasn't recorded their
+    new path yet. Since those locations are shared by files with the same
+    name, a file found there is only used if it matches the record.
+    Returns None if the file can't be found.
+    """
+    recorded_path = get_stored_path(config, original_path, stored_path)
+    if os.path.isfile(recorded_path):
+        return recorded_path
+
+    fallbacks = [get_archive_path(config, original_path), _flat_archive_path(config, original_path)]
+    for candidate in dict.fromkeys(fallbacks):
+        if candidate == recorded_path or not os.path.isfile(candidate):
+            continue
+        if _is_fallback_match(db_handler, file_id, candidate, original_size):
+            return candidate
+        logging.warning(f"Ignoring '{candidate}' for file ID {file_id}: it belongs to another file.")
+    return None
+
+def _locate_record_file(db_handler, config, file_record):
+    """Locates the archived file of an 'archive' table row."""
+    return locate_archived_file(
+        db_handler, config, file_record[0], file_record[1],
+        _record_stored_path(file_record),
+        file_record[5] if len(file_record) > 5 else None
+    )
+
+def _record_stored_path(file_record):
+    """Returns the stored_path column of an archive record, if it has one."""
+    return file_record[4] if len(file_record) > 4 else None
+
+def _find_scan_root(config, file_path):
+    """Returns the configured scan directory a file path lies under, if any."""
+    for directory in config.get('scan_directories') or []:
+        if os.path.commonpath([os.path.abspath(directory), os.path.abspath(file_path)]) == os.path.abspath(directory):
+            return directory
+    return None
+
+def backfill_storage_details(db_handler, config):
+    """
+    Fills in the storage details of records archived before they were tracked.
+    Such files were always placed in a flat archive, so each one is stat'ed
+    there once. Records whose file is missing still get that location stored,
+    so they are not looked up again.
+
+    :return: The number of records updated.
+    """
+    records = db_handler.get_records_without_storage_details()
+    if not records:
+        return 0
+
+    with db_handler.transaction():
+        for file_id, original_path in records:
+            stored_path = os.path.abspath(_flat_archive_path(config, original_path))
+            try:
+                stat = os.stat(stored_path)
+                # shutil.move keeps the modification time, so it is still the original one
+                size, mtime, device = stat.st_size, datetime.fromtimestamp(stat.st_mtime).isoformat(), stat.st_dev
+            except OSError as e:
+                logging.warning(f"Could not backfill size of file ID {file_id} ({stored_path}): {e}")
+                size, mtime, device = None, None, None
+            db_handler.record_storage_details(
+                file_id, stored_path, size, mtime, _find_scan_root(config, original_path), device
+            )
+
+    logging.info(f"Backfilled storage details for {len(records)} archived files.")
+    return len(records)
+
+def hash_file(file_path):
+    """
+    Computes the SHA-256 checksum of a file without loading it into memory.
+    The file is memory-mapped and hashed in chunks; empty files, which cannot
+    be mapped, fall back to a plain read.
+
+    :param file_path: The path of the file to hash.
+    :return: The hex digest of the file's contents.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    for offset in range(0, len(view), HASH_CHUNK_SIZE):
+                        digest.update(view[offset:offset + HASH_CHUNK_SIZE])
+                finally:
+                    view.release()
+        except ValueError:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+def iter_inactive_files(directories, days_inactive):
+    """
+    Walks the given directories and yields files that haven't been modified recently.
+
     :param directories: A list of directory paths to scan.
     :param days_inactive: The threshold in days for a file to be considered inactive.
-    :return: A list of full paths to inactive files.
+    :return: A generator of (file_path, scan_root, stat_result) tuples, with
+             absolute file paths so records don't depend on the working directory.
     """
-    inactive_files = []
     threshold = timedelta(days=days_inactive)
     now = datetime.now()
 
@@ -22,65 +184,136 @@ def find_inactive_files(directories, days_inactive):
         
         for root, _, files in os.walk(directory):
             for filename in files:
-                file_path = os.path.join(root, filename)
+                file_path = os.path.abspath(os.path.join(root, filename))
                 try:
-                    modified_time = datetime.fromtimestamp(os.path.getmtime(file_path))
+                    stat = os.stat(file_path)
+                    modified_time = datetime.fromtimestamp(stat.st_mtime)
                     if now - modified_time > threshold:
-                        inactive_files.append(file_path)
+                        yield file_path, directory, stat
                 except FileNotFoundError:
                     logging.warning(f"File not found during scan: {file_path}")
                     continue
-    return inactive_files
+
+def find_inactive_files(directories, days_inactive):
+    """
+    Finds files in the given directories that haven't been modified recently.
+    
+    :param directories: A list of directory paths to scan.
+    :param days_inactive: The threshold in days for a file to be considered inactive.
+    :return: A list of full paths to inactive files.
+    """
+    return [file_path for file_path, _, _ in iter_inactive_files(directories, days_inactive)]
 
 def scan_and_archive_files(db_handler, config):
     """
     Scans for inactive files and moves them to the archive directory,
     updating the database for each.
     """
-    inactive_files = find_inactive_files(
+    inactive_files = list(iter_inactive_files(
         config['scan_directories'],
         config['days_until_archive']
-    )
-    
+    ))
+    archive_files(db_handler, config, inactive_files)
+
+def archive_files(db_handler, config, inactive_files):
+    """
+    Moves the given files to the archive directory and updates the database for each.
+    Moving (with its database writes) and hashing are timed separately, since
+    moves cost roughly the same per file within a device while hashing reads
+    every byte, so later plans can estimate durations for any mix of file sizes.
+
+    :param inactive_files: A list of (file_path, scan_root, stat_result) tuples,
+                           as produced by iter_inactive_files().
+    """
     archive_root = config['archive_directory']
     os.makedirs(archive_root, exist_ok=True)
+    created_dirs = {archive_root}
+    throughput = {}
 
-    for file_path in inactive_files:
+    for file_path, scan_root, original_stat in inactive_files:
+        started = time.perf_counter()
         try:
             # Move the file first
-            filename = os.path.basename(file_path)
-            destination_path = os.path.join(archive_root, filename)
+            destination_path = get_archive_path(config, file_path)
+            destination_dir = os.path.dirname(destination_path)
+            if destination_dir not in created_dirs:
+                os.makedirs(destination_dir, exist_ok=True)
+                created_dirs.add(destination_dir)
             shutil.move(file_path, destination_path)
             
-            # Check if the record already exists in the database
-            existing_record = db_handler.get_file_by_path(file_path)
-
-            if existing_record:
-                # If it exists (e.g., it was restored), just update its status
-                record_id = existing_record[0]
-                db_handler.update_file_status(record_id, 'archived')
-                logging.info(f"Re-archived '{file_path}' to '{destination_path}'")
-            else:
-                # If it's a new file, add a completely new record
-                archive_date = datetime.now().isoformat()
-                db_handler.add_file_record(file_path, 'archived', archive_date)
-                logging.info(f"Archived new file '{file_path}' to '{destination_path}'")
+            moved = time.perf_counter()
+
+            # The file has moved, so it must be recorded even if it can't be hashed;
+            # verify_archive() records a baseline checksum for it later
+            stat = os.stat(destination_path)
+            try:
+                checksum = hash_file(destination_path)
+            except OSError as e:
+                checksum = None
+                logging.warning(f"Could not hash archived file '{destination_path}', recording it without a checksum: {e}")
+            hashed = time.perf_counter()
+
+            # Write the status, storage details and checksum in one commit
+            with db_handler.transaction():
+                # Check if the record already exists in the database
+                existing_record = db_handler.get_file_by_path(file_path)
+
+                if existing_record:
+                    # If it exists (e.g., it was restored), just update its status
+                    record_id = existing_record[0]
+                    db_handler.update_file_status(record_id, 'archived')
+                    logging.info(f"Re-archived '{file_path}' to '{destination_path}'")
+                else:
+                    # If it's a new file, add a completely new record
+                    archive_date = datetime.now().isoformat()
+                    record_id = db_handler.add_file_record(file_path, 'archived', archive_date)
+                    logging.info(f"Archived new file '{file_path}' to '{destination_path}'")
+
+                # Record where the file went and the reference checksum so later
+                # verifications can detect corruption
+                if record_id is not None:
+                    db_handler.record_storage_details(
+                        record_id,
+                        os.path.abspath(destination_path),
+                        original_stat.st_size,
+                        datetime.fromtimestamp(original_stat.st_mtime).isoformat(),
+                        scan_root,
+                        stat.st_dev
+                    )
+                    if checksum is not None:
+                        db_handler.record_checksum(record_id, checksum, stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns)
+
+            operation = 'move_same_device' if stat.st_dev == original_stat.st_dev else 'move_cross_device'
+            move_seconds = (moved - started) + (time.perf_counter() - hashed)
+            _add_throughput(throughput, operation, original_stat.st_size, move_seconds)
+            if checksum is not None:
+                _add_throughput(throughput, 'hash', stat.st_size, hashed - moved)
             
         except Exception as e:
             logging.error(f"Failed to archive file {file_path}: {e}")
 
-def purge_old_files(db_handler, config):
-    """
-    Finds files in the archive that are older than the deletion threshold
-    and permanently deletes them.
-    """
+    _save_throughput(db_handler, throughput)
+
+def _add_throughput(throughput, operation, size, seconds):
+    """Adds one processed file to the running (files, bytes, seconds) totals of an operation."""
+    files, total_bytes, total_seconds = throughput.get(operation, (0, 0, 0.0))
+    throughput[operation] = (files + 1, total_bytes + (size or 0), total_seconds + seconds)
+
+def _save_throughput(db_handler, throughput):
+    """Stores the throughput measured during a run."""
+    for operation, (files, total_bytes, seconds) in throughput.items():
+        db_handler.record_throughput(operation, files, total_bytes, seconds)
+
+def find_purgeable_records(db_handler, config):
+    """Returns the archived records that are older than the deletion threshold."""
     archived_files = db_handler.get_files_by_status('archived')
     threshold = timedelta(days=config['days_until_delete'])
     now = datetime.now()
-    
+    purgeable = []
+
     for file_record in archived_files:
-        file_id, original_path, _, date_archived_str = file_record
-        
+        file_id, original_path, _, date_archived_str = file_record[:4]
+
         try:
             if not date_archived_str:
                 logging.warning(f"Skipping purge for file ID {file_id} due to missing archive date.")
@@ -88,30 +321,71 @@ def purge_old_files(db_handler, config):
 
             date_archived = datetime.fromisoformat(date_archived_str)
             if now - date_archived > threshold:
-                filename = os.path.basename(original_path)
-                archived_file_path = os.path.join(config['archive_directory'], filename)
-                
-                if os.path.exists(archived_file_path):
-                    os.remove(archived_file_path)
-                    logging.info(f"Deleted file from disk: {archived_file_path}")
-                
+                purgeable.append(file_record)
+        except ValueError as e:
+            logging.error(f"Failed to read archive date of file ID {file_id} ({original_path}): {e}")
+    return purgeable
+
+def purge_old_files(db_handler, config):
+    """
+    Finds files in the archive that are older than the deletion threshold
+    and permanently deletes them.
+    """
+    purge_files(db_handler, config, find_purgeable_records(db_handler, config))
+
+def purge_files(db_handler, config, file_records):
+    """
+    Permanently deletes the given archived records and their files.
+    Records whose file can't be found anywhere are removed as well.
+    """
+    throughput = {}
+
+    for file_record in file_records:
+        file_id, original_path = file_record[0], file_record[1]
+        started = time.perf_counter()
+        
+        try:
+            archived_file_path = _locate_record_file(db_handler, config, file_record)
+            if archived_file_path is None:
+                # The lookup also checks where a reshard may have just moved the
+                # file, so a record with no file anywhere is only a dangling row
                 db_handler.remove_file_record(file_id)
+                logging.warning(f"Removed dangling record for file ID {file_id}: archived file not found.")
+                continue
+
+            os.remove(archived_file_path)
+            logging.info(f"Deleted file from disk: {archived_file_path}")
+            
+            db_handler.remove_file_record(file_id)
+            size = file_record[5] if len(file_record) > 5 else None
+            _add_throughput(throughput, 'purge', size, time.perf_counter() - started)
         except Exception as e:
             logging.error(f"Failed to purge file with ID {file_id} ({original_path}): {e}")
 
+    _save_throughput(db_handler, throughput)
+
 def restore_file(db_handler, config, file_id):
-    """Restores a single file from the archive to its original location."""
+    """
+    Restores a single file from the archive to its original location.
+    Returns True if the file was restored, False otherwise.
+    """
     file_record = db_handler.get_file_by_id(file_id)
     if not file_record:
         logging.error(f"Restore failed: No file found with ID {file_id}")
-        return
+        return False
+    if file_record[2] != 'archived':
+        logging.error(f"Restore failed: file ID {file_id} is not archived (status '{file_record[2]}')")
+        return False
 
-    _, original_path, _, _ = file_record
-    filename = os.path.basename(original_path)
-    archived_file_path = os.path.join(config['archive_directory'], filename)
+    original_path = file_record[1]
     original_dir = os.path.dirname(original_path)
     
     try:
+        archived_file_path = _locate_record_file(db_handler, config, file_record)
+        if archived_file_path is None:
+            logging.error(f"Restore failed: archived file for ID {file_id} not found")
+            return False
+
         os.makedirs(original_dir, exist_ok=True)
         shutil.move(archived_file_path, original_path)
         
@@ -120,8 +394,10 @@ def restore_file(db_handler, config, file_id):
 
         db_handler.update_file_status(file_id, 'restored')
         logging.info(f"Restored '{archived_file_path}' to '{original_path}'")
+        return True
     except Exception as e:
         logging.error(f"Failed to restore file ID {file_id}: {e}")
+        return False
 
 def delete_archived_file(db_handler, config, file_id):
     """Force-deletes a file from the archive and the database."""
@@ -130,14 +406,69 @@ def delete_archived_file(db_handler, config, file_id):
         logging.error(f"Delete failed: No file found with ID {file_id}")
         return
         
-    _, original_path, _, _ = file_record
-    filename = os.path.basename(original_path)
-    archived_file_path = os.path.join(config['archive_directory'], filename)
-
     try:
-        if os.path.exists(archived_file_path):
+        archived_file_path = _locate_record_file(db_handler, config, file_record)
+        if archived_file_path is not None:
             os.remove(archived_file_path)
         db_handler.remove_file_record(file_id)
         logging.info(f"Force-deleted file ID {file_id} ({archived_file_path})")
     except Exception as e:
-        logging.error(f"Failed to force-delete file ID {file_id}: {e}")
\ No newline at end of file
+        logging.error(f"Failed to force-delete file ID {file_id}: {e}")
+
+def _remove_empty_directories(archive_root):
+    """Removes empty subdirectories left behind in the archive, keeping the root itself."""
+    for root, _, _ in os.walk(archive_root, topdown=False):
+        if os.path.abspath(root) == os.path.abspath(archive_root):
+            continue
+        try:
+            os.rmdir(root)
+        except OSError:
+            pass # Not empty
+
+def reshard_archive(db_handler, config):
+    """
+    Moves every archived file to the location given by the configured archive
+    layout and updates its stored path.
+
+    The migration runs online: each file is renamed inside the archive
+    directory and its new path is committed straight away, so other
+    processes see it almost immediately. Lookups also fall back to the
+    layout locations for the moment in between. If it is interrupted,
+    running it again picks up a file that was moved but not yet recorded.
+    """
+    archived_files = db_handler.get_files_by_status('archived')
+    moved = 0
+    unchanged = 0
+    failed = 0
+
+    for file_record in archived_files:
+        file_id, original_path = file_record[0], file_record[1]
+        current_path = get_stored_path(config, original_path, _record_stored_path(file_record))
+        target_path = os.path.abspath(get_archive_path(config, original_path))
+
+        try:
+            if os.path.abspath(current_path) == target_path:
+                unchanged += 1
+                continue
+
+            if os.path.exists(current_path):
+                if os.path.exists(target_path):
+                    logging.error(f"Reshard skipped file ID {file_id}: {target_path} already exists")
+                    failed += 1
+                    continue
+                os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                os.rename(current_path, target_path)
+            elif not os.path.exists(target_path):
+                logging.error(f"Reshard skipped file ID {file_id}: not found at {current_path}")
+                failed += 1
+                continue
+
+            db_handler.update_stored_paths([(file_id, target_path)])
+            moved += 1
+        except Exception as e:
+            logging.error(f"Failed to reshard file ID {file_id} ({current_path}): {e}")
+            failed += 1
+
+    _remove_empty_directories(config['archive_directory'])
+    logging.info(f"Reshard complete. Moved: {moved}, already in place: {unchanged}, failed: {failed}.")
+    return moved, unchanged, failed
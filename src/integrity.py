@@ -0,0 +1,128 @@
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from src.file_handler import get_stored_path, hash_file, locate_archived_file
+
+def _hash_worker(file_path):
+    """
+    Hashes a single file inside a worker process.
+    Returns a (checksum, error) tuple so one unreadable file doesn't abort the pool.
+    """
+    try:
+        return hash_file(file_path), None
+    except OSError as e:
+        return None, str(e)
+
+def _hash_files(paths, workers):
+    """Hashes the given files in a process pool, preserving their order."""
+    if not paths:
+        return []
+    if workers == 1 or len(paths) == 1:
+        return [_hash_worker(path) for path in paths]
+    chunksize = max(1, len(paths) // ((workers or os.cpu_count() or 1) * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_hash_worker, paths, chunksize=chunksize))
+
+def find_orphaned_files(archive_root, expected_paths):
+    """
+    Lists files inside the archive directory that no archived record points to.
+
+    :param archive_root: The archive directory to walk.
+    :param expected_paths: A set of absolute paths the database expects to find.
+    :return: A sorted list of orphaned file paths.
+    """
+    orphaned = []
+    if not os.path.isdir(archive_root):
+        return orphaned
+    for root, _, files in os.walk(archive_root):
+        for filename in files:
+            file_path = os.path.abspath(os.path.join(root, filename))
+            if file_path not in expected_paths:
+                orphaned.append(file_path)
+    return sorted(orphaned)
+
+def verify_archive(db_handler, config, full=False):
+    """
+    Checks that the files in the archive directory still match the database.
+
+    Archived files are re-hashed in a process pool and compared against the
+    checksum recorded when they were archived. Files whose size and stat times
+    are unchanged since their last successful verification are skipped unless
+    `full` is set. Files archived before checksums were recorded get their
+    current checksum stored as a baseline.
+
+    :return: A dict with the 'verified', 'skipped', 'baselined', 'corrupted',
+             'missing', 'unreadable' and 'orphaned' results.
+    """
+    report = {
+        'verified': 0,
+        'skipped': 0,
+        'baselined': 0,
+        'corrupted': [],
+        'missing': [],
+        'unreadable': [],
+        'orphaned': [],
+    }
+    expected_paths = set()
+    pending = []
+
+    for record in db_handler.get_archived_integrity():
+        file_id, original_path, stored_path, checksum, size, verified_size, verified_mtime_ns, verified_ctime_ns = record
+        archived_file_path = (
+            locate_archived_file(db_handler, config, file_id, original_path, stored_path, size)
+            or get_stored_path(config, original_path, stored_path)
+        )
+        expected_paths.add(os.path.abspath(archived_file_path))
+
+        try:
+            stat = os.stat(archived_file_path)
+        except (FileNotFoundError, NotADirectoryError):
+            report['missing'].append((file_id, archived_file_path))
+            logging.warning(f"Archived file ID {file_id} is missing from disk: {archived_file_path}")
+            continue
+        except OSError as e:
+            report['unreadable'].append((file_id, archived_file_path))
+            logging.error(f"Could not stat archived file ID {file_id} ({archived_file_path}): {e}")
+            continue
+
+        unchanged = (
+            checksum is not None
+            and verified_size == stat.st_size
+            and verified_mtime_ns == stat.st_mtime_ns
+            and verified_ctime_ns == stat.st_ctime_ns
+        )
+        if unchanged and not full:
+            report['skipped'] += 1
+            continue
+        pending.append((file_id, archived_file_path, checksum, size, stat))
+
+    results = _hash_files([entry[1] for entry in pending], config.get('verify_workers'))
+
+    verified = []
+    for (file_id, archived_file_path, checksum, size, stat), (actual, error) in zip(pending, results):
+        if error:
+            report['unreadable'].append((file_id, archived_file_path))
+            logging.error(f"Could not read archived file ID {file_id} ({archived_file_path}): {error}")
+        elif checksum is None:
+            db_handler.record_checksum(file_id, actual, stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns)
+            report['baselined'] += 1
+        elif actual != checksum or stat.st_size != size:
+            report['corrupted'].append((file_id, archived_file_path))
+            logging.error(f"Checksum mismatch for archived file ID {file_id}: {archived_file_path}")
+        else:
+            verified.append((file_id, stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns))
+
+    if verified:
+        db_handler.record_verifications(verified)
+    report['verified'] = len(verified)
+
+    report['orphaned'] = find_orphaned_files(config['archive_directory'], expected_paths)
+    for orphan in report['orphaned']:
+        logging.warning(f"Orphaned file in archive with no database record: {orphan}")
+
+    logging.info(
+        f"Verification complete. Verified: {report['verified']}, skipped (unchanged): {report['skipped']}, "
+        f"baselined: {report['baselined']}, corrupted: {len(report['corrupted'])}, "
+        f"missing: {len(report['missing'])}, unreadable: {len(report['unreadable'])}, orphaned: {len(report['orphaned'])}."
+    )
+    return report
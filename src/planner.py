@@ -0,0 +1,156 @@
+import os
+import logging
+import src.file_handler as fh
+
+# How each measured operation is scaled to planned work: moves within a device
+# and purges cost roughly the same per file, while cross-device moves copy the
+# data and hashing reads all of it, so those are bound by bytes.
+ESTIMATE_BY_BYTES = {'move_cross_device', 'hash'}
+
+def _device_of(path):
+    """Returns the device ID of a path, or of its nearest existing parent directory."""
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return os.stat(path).st_dev
+
+def _new_summary():
+    """Returns an empty summary for one kind of planned work."""
+    return {
+        'files': 0,
+        'bytes': 0,
+        'same_device_files': 0,
+        'same_device_bytes': 0,
+        'cross_device_files': 0,
+        'cross_device_bytes': 0,
+        'estimated_seconds': 0.0,
+        'unestimated_files': 0,
+    }
+
+def _estimate_seconds(operation, files, total_bytes, throughput):
+    """
+    Estimates how long an operation takes for the given work, using measured throughput.
+    Returns None if the operation has not been measured yet.
+    """
+    measured_files, measured_bytes, measured_seconds = throughput.get(operation, (0, 0, 0.0))
+    if operation in ESTIMATE_BY_BYTES:
+        return total_bytes * measured_seconds / measured_bytes if measured_bytes else None
+    return files * measured_seconds / measured_files if measured_files else None
+
+def _add_estimate(summary, files, total_bytes, operations, throughput):
+    """Adds the estimated duration of some planned work, made up of the given operations, to a summary."""
+    if not files:
+        return
+    estimates = [_estimate_seconds(operation, files, total_bytes, throughput) for operation in operations]
+    if None in estimates:
+        summary['unestimated_files'] += files
+    else:
+        summary['estimated_seconds'] += sum(estimates)
+
+def plan_archive(db_handler, config):
+    """
+    Works out what scan_and_archive_files() would do without changing anything.
+
+    :return: A dict with the planned 'actions' and a 'summary'. Each action
+             keeps the stat data collected by the scan so the plan can be
+             executed later without rescanning.
+    """
+    archive_device = _device_of(config['archive_directory'])
+    actions = []
+    summary = _new_summary()
+
+    for file_path, scan_root, stat in fh.iter_inactive_files(config['scan_directories'], config['days_until_archive']):
+        existing_record = db_handler.get_file_by_path(file_path)
+        same_device = stat.st_dev == archive_device
+        actions.append({
+            'action': 're-archive' if existing_record else 'archive',
+            'source': file_path,
+            'destination': fh.get_archive_path(config, file_path),
+            'size': stat.st_size,
+            'same_device': same_device,
+            'scan_root': scan_root,
+            'stat': stat,
+        })
+        prefix = 'same_device' if same_device else 'cross_device'
+        summary['files'] += 1
+        summary['bytes'] += stat.st_size
+        summary[f'{prefix}_files'] += 1
+        summary[f'{prefix}_bytes'] += stat.st_size
+
+    throughput = db_handler.get_throughput()
+    _add_estimate(summary, summary['same_device_files'], summary['same_device_bytes'], ['move_same_device', 'hash'], throughput)
+    _add_estimate(summary, summary['cross_device_files'], summary['cross_device_bytes'], ['move_cross_device', 'hash'], throughput)
+    return {'actions': actions, 'summary': summary}
+
+def plan_purge(db_handler, config):
+    """
+    Works out what purge_old_files() would do without changing anything.
+    Sizes come from the database, so the archive itself is not touched.
+
+    :return: A dict with the planned 'actions' and a 'summary'.
+    """
+    actions = []
+    summary = _new_summary()
+
+    for file_record in fh.find_purgeable_records(db_handler, config):
+        size = (file_record[5] if len(file_record) > 5 else None) or 0
+        actions.append({
+            'action': 'purge',
+            'file_id': file_record[0],
+            'source': fh.get_stored_path(config, file_record[1], file_record[4] if len(file_record) > 4 else None),
+            'size': size,
+            'record': file_record,
+        })
+        summary['files'] += 1
+        summary['bytes'] += size
+
+    _add_estimate(summary, summary['files'], summary['bytes'], ['purge'], db_handler.get_throughput())
+    return {'actions': actions, 'summary': summary}
+
+def execute_archive_plan(db_handler, config, plan):
+    """
+    Archives the files in an approved plan without rescanning the directories.
+    Files that changed since the plan was made are skipped, since they may be in use again.
+
+    :return: The number of planned files that were skipped.
+    """
+    entries = []
+    skipped = 0
+    for action in plan['actions']:
+        planned = action['stat']
+        try:
+            current = os.stat(action['source'])
+        except FileNotFoundError:
+            current = None
+        if current is None or (current.st_size, current.st_mtime_ns, current.st_ino) != (planned.st_size, planned.st_mtime_ns, planned.st_ino):
+            logging.warning(f"Skipping '{action['source']}': it changed after the plan was made.")
+            skipped += 1
+            continue
+        entries.append((action['source'], action['scan_root'], current))
+
+    fh.archive_files(db_handler, config, entries)
+    return skipped
+
+def execute_purge_plan(db_handler, config, plan):
+    """
+    Purges the records in an approved plan.
+    Records that were restored or re-archived since the plan was made are skipped.
+
+    :return: The number of planned records that were skipped.
+    """
+    records = []
+    skipped = 0
+    for action in plan['actions']:
+        planned = action['record']
+        current = db_handler.get_file_by_id(planned[0])
+        if not current or current[2] != 'archived' or current[3] != planned[3]:
+            logging.warning(f"Skipping purge of file ID {planned[0]}: it changed after the plan was made.")
+            skipped += 1
+            continue
+        records.append(current)
+
+    fh.purge_files(db_handler, config, records)
+    return skipped
@@ -0,0 +1,229 @@
+import os
+import json
+import asyncio
+import logging
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from src.database import DatabaseHandler
+import src.file_handler as fh
+
+# Column names of an 'archive' row, used to turn records into JSON objects.
+RECORD_FIELDS = (
+    'id', 'file_path', 'status', 'date_archived', 'stored_path',
+    'original_size', 'original_mtime', 'scan_root', 'storage_device',
+)
+
+# Finished restore tasks are kept for polling for this many seconds, and at
+# most this many of them are kept at once.
+DEFAULT_TASK_TTL = 3600
+MAX_FINISHED_TASKS = 1000
+
+def record_to_dict(record):
+    """Converts an 'archive' row tuple into a dict keyed by column name."""
+    return dict(zip(RECORD_FIELDS, record))
+
+class ArchiveService:
+    """
+    A local query/control service for the archive, served over a Unix domain socket.
+
+    Clients send one JSON object per line and receive one JSON object per line
+    back, either {"ok": true, "result": ...} or {"ok": false, "error": "..."}.
+    Supported actions:
+      {"action": "list", "status": "archived", "limit": 100, "after_id": 0}
+      {"action": "search", "pattern": "report", "limit": 100}
+      {"action": "status", "path": "/data/report.pdf"}  (or "id": 12)
+      {"action": "restore", "id": 12}  -> returns a task ID straight away
+      {"action": "task", "task_id": 1}
+
+    Read requests are answered from a small pool of read-only connections so
+    lookups never wait on each other or on archiving. Restores run as
+    background tasks on a single writer connection; finished tasks can be
+    polled until 'service_task_ttl' seconds have passed.
+    """
+    def __init__(self, config, socket_path=None, read_connections=None):
+        """
+        Initializes the service.
+        :param config: The application configuration.
+        :param socket_path: The Unix socket to listen on. Defaults to 'service_socket' from the config.
+        :param read_connections: The size of the read pool. Defaults to 'service_read_connections' or 4.
+        """
+        self.config = config
+        self.socket_path = socket_path or config.get('service_socket', 'archiver.sock')
+        self.read_connections = read_connections or config.get('service_read_connections', 4)
+        self.server = None
+        self.tasks = {}
+        self.task_ttl = config.get('service_task_ttl', DEFAULT_TASK_TTL)
+        self._finished_at = {}
+        self._task_ids = itertools.count(1)
+        self._read_pool = None
+        self._read_handlers = []
+        self._writer = None
+        self._writer_executor = None
+        self._background = set()
+
+    async def start(self):
+        """Opens the database connections and starts listening on the socket."""
+        # The writer connection lives on its own thread, since sqlite3
+        # connections may only be used by the thread that created them.
+        self._writer_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='archive-writer')
+        self._writer = DatabaseHandler(self.config['database_name'])
+        await self._run_on_writer(self._open_writer)
+
+        self._read_pool = asyncio.Queue()
+        for _ in range(self.read_connections):
+            handler = DatabaseHandler(self.config['database_name'])
+            if not handler.connect(read_only=True):
+                raise RuntimeError(f"Could not open a read connection to {self.config['database_name']}")
+            self._read_handlers.append(handler)
+            self._read_pool.put_nowait(handler)
+
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path) # Left behind by a previous run
+        self.server = await asyncio.start_unix_server(self._handle_client, path=self.socket_path)
+        logging.info(f"Archive service listening on {self.socket_path}")
+
+    def _open_writer(self):
+        """Connects the writer handler and prepares the database for concurrent readers."""
+        if not self._writer.connect():
+            raise RuntimeError(f"Could not connect to {self.config['database_name']}")
+        self._writer.setup_table()
+        fh.backfill_storage_details(self._writer, self.config)
+        self._writer.enable_wal_mode()
+
+    async def _run_on_writer(self, func, *args):
+        """Runs a function on the writer thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer_executor, func, *args)
+
+    async def serve_forever(self):
+        """Serves requests until cancelled."""
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        """Stops the server, waits for running restores and closes all connections."""
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+        for handler in self._read_handlers:
+            handler.close()
+        self._read_handlers = []
+        if self._writer_executor:
+            await self._run_on_writer(self._writer.close)
+            self._writer_executor.shutdown()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        logging.info("Archive service stopped.")
+
+    async def _read(self, method_name, *args):
+        """Runs a DatabaseHandler query on a pooled read-only connection."""
+        handler = await self._read_pool.get()
+        try:
+            return await asyncio.to_thread(getattr(handler, method_name), *args)
+        finally:
+            self._read_pool.put_nowait(handler)
+
+    async def _handle_client(self, reader, writer):
+        """Answers requests from one client until it disconnects."""
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    # The rest of an oversized line can't be told apart from the next request
+                    writer.write(json.dumps({'ok': False, 'error': 'Request line too long.'}).encode() + b'\n')
+                    await writer.drain()
+                    break
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("Request must be a JSON object.")
+                    response = {'ok': True, 'result': await self.dispatch(request)}
+                except (ValueError, KeyError, TypeError) as e:
+                    response = {'ok': False, 'error': str(e)}
+                except Exception as e:
+                    logging.error(f"Archive service request failed: {e}", exc_info=True)
+                    response = {'ok': False, 'error': 'Internal error.'}
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass # The client went away mid-request
+        finally:
+            writer.close()
+
+    async def dispatch(self, request):
+        """Runs a single decoded request and returns its result."""
+        action = request.get('action')
+        if action == 'list':
+            records = await self._read(
+                'get_files_by_status', request.get('status', 'archived'),
+                int(request.get('limit', 100)), int(request.get('after_id', 0))
+            )
+            return [record_to_dict(record) for record in records]
+        if action == 'search':
+            records = await self._read('search_files', str(request['pattern']), int(request.get('limit', 100)))
+            return [record_to_dict(record) for record in records]
+        if action == 'status':
+            if 'id' in request:
+                record = await self._read('get_file_by_id', int(request['id']))
+            else:
+                # Records hold absolute paths, so resolve relative ones the way the archiver does
+                record = await self._read('get_file_by_path', os.path.abspath(str(request['path'])))
+            return record_to_dict(record) if record else None
+        if action == 'restore':
+            file_id = int(request['id'])
+            record = await self._read('get_file_by_id', file_id)
+            if not record:
+                raise ValueError(f"No file found with ID {file_id}.")
+            if record[2] != 'archived':
+                raise ValueError(f"File ID {file_id} is not archived (status '{record[2]}').")
+            return self.start_restore(file_id)
+        if action == 'task':
+            task_id = int(request['task_id'])
+            if task_id not in self.tasks:
+                raise KeyError(f"Unknown task ID {task_id}")
+            return self.tasks[task_id]
+        raise ValueError(f"Unknown action '{action}'.")
+
+    def _evict_finished_tasks(self):
+        """Forgets finished tasks older than the TTL, and the oldest ones beyond the size cap."""
+        # Tasks are recorded in the order they finish, so the oldest come first
+        cutoff = asyncio.get_running_loop().time() - self.task_ttl
+        for task_id, finished in list(self._finished_at.items()):
+            if finished >= cutoff and len(self._finished_at) <= MAX_FINISHED_TASKS:
+                break
+            del self._finished_at[task_id]
+            del self.tasks[task_id]
+
+    def start_restore(self, file_id):
+        """Schedules a restore in the background and returns its task record."""
+        self._evict_finished_tasks()
+        task_id = next(self._task_ids)
+        self.tasks[task_id] = {'task_id': task_id, 'action': 'restore', 'file_id': file_id, 'state': 'running'}
+        task = asyncio.create_task(self._restore(task_id, file_id))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return self.tasks[task_id]
+
+    async def _restore(self, task_id, file_id):
+        """Restores a file on the writer thread and records the outcome."""
+        try:
+            restored = await self._run_on_writer(fh.restore_file, self._writer, self.config, file_id)
+            self.tasks[task_id]['state'] = 'done' if restored else 'failed'
+        except Exception as e:
+            logging.error(f"Background restore of file ID {file_id} failed: {e}")
+            self.tasks[task_id]['state'] = 'failed'
+        self._finished_at[task_id] = asyncio.get_running_loop().time()
+
+async def run_service(config):
+    """Starts the archive service and serves until cancelled."""
+    service = ArchiveService(config)
+    await service.start()
+    try:
+        await service.serve_forever()
+    finally:
+        await service.close()
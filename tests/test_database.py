@@ -1,5 +1,7 @@
 import unittest
 import os
+import sqlite3
+import tempfile
 from datetime import datetime
 from src.database import DatabaseHandler
 
@@ -66,5 +68,111 @@ class TestDatabaseHandler(unittest.TestCase):
         self.db_handler.remove_file_record(record_id)
         self.assertIsNone(self.db_handler.get_file_by_id(record_id))
 
+    def test_record_checksum_and_verifications(self):
+        """Test storing a checksum and updating the last verified state."""
+        record_id = self.db_handler.add_file_record("/path/archived.txt", "archived", datetime.now().isoformat())
+        self.db_handler.record_checksum(record_id, "abc123", 42)
+
+        record = self.db_handler.get_archived_integrity()[0]
+        self.assertEqual(record[:5], (record_id, "/path/archived.txt", None, "abc123", 42))
+        self.assertIsNone(record[5], "A checksum recorded without stat data should not count as verified")
+
+        self.db_handler.record_verifications([(record_id, 42, 1000, 2000)])
+        record = self.db_handler.get_archived_integrity()[0]
+        self.assertEqual(record[5:], (42, 1000, 2000))
+
+        self.db_handler.remove_file_record(record_id)
+        self.assertEqual(self.db_handler.get_archived_integrity(), [])
+
+    def test_transaction_commits_once(self):
+        """Test that writes inside a transaction are committed together, or rolled back on error."""
+        db_path = os.path.join(tempfile.mkdtemp(), "transaction.db")
+        handler = DatabaseHandler(db_path)
+        handler.connect()
+        handler.setup_table()
+        observer = sqlite3.connect(db_path)
+        try:
+            with handler.transaction():
+                record_id = handler.add_file_record("/tx/one.txt", "archived", "2024-01-01")
+                handler.record_storage_details(record_id, "/archive/one.txt", 5, None, "/tx", None)
+                handler.record_checksum(record_id, "abc", 5)
+                self.assertEqual(observer.execute("SELECT COUNT(*) FROM archive").fetchone()[0], 0)
+            self.assertEqual(observer.execute("SELECT stored_path FROM archive").fetchall(), [("/archive/one.txt",)])
+
+            with self.assertRaises(RuntimeError):
+                with handler.transaction():
+                    handler.add_file_record("/tx/two.txt", "archived", "2024-01-01")
+                    raise RuntimeError("boom")
+            self.assertIsNone(handler.get_file_by_path("/tx/two.txt"))
+        finally:
+            observer.close()
+            handler.close()
+            os.remove(db_path)
+            os.rmdir(os.path.dirname(db_path))
+
+    def test_migrates_legacy_table(self):
+        """Test that an archive table from an older version gains the new columns and keeps its rows."""
+        db_path = os.path.join(tempfile.mkdtemp(), "legacy.db")
+        conn = sqlite3.connect(db_path)
+        conn.execute("""
+            CREATE TABLE archive (
+                id INTEGER PRIMARY KEY,
+                file_path TEXT NOT NULL UNIQUE,
+                status TEXT DEFAULT 'active' CHECK(status IN ('active', 'archived', 'restored')),
+                date_archived TEXT
+            )
+        """)
+        conn.execute("INSERT INTO archive (file_path, status, date_archived) VALUES ('/old.txt', 'archived', '2024-01-02')")
+        conn.execute("INSERT INTO archive (file_path, status) VALUES ('./docs/relative.txt', 'restored')")
+        conn.execute("INSERT INTO archive (file_path, status) VALUES ('./docs/twice.txt', 'restored')")
+        conn.execute("INSERT INTO archive (file_path, status) VALUES (?, 'active')", (os.path.abspath('docs/twice.txt'),))
+        conn.commit()
+        conn.close()
+
+        legacy_handler = DatabaseHandler(db_path)
+        legacy_handler.connect()
+        legacy_handler.setup_table()
+        try:
+            record = legacy_handler.get_file_by_path('/old.txt')
+            self.assertEqual(record[:4], (1, '/old.txt', 'archived', '2024-01-02'))
+            self.assertEqual(len(record), 9)
+            self.assertIsNone(record[4], "Migrated rows have no stored path until re-archived")
+            self.assertEqual(legacy_handler.get_file_by_path(os.path.abspath('docs/relative.txt'))[0], 2)
+            self.assertIsNotNone(legacy_handler.get_file_by_path('./docs/twice.txt'), "Paths already tracked are left alone")
+        finally:
+            legacy_handler.close()
+            os.remove(db_path)
+            os.rmdir(os.path.dirname(db_path))
+
+    def test_space_reports(self):
+        """Test the aggregate space queries by status, scan root and archive month."""
+        records = [
+            ("/a/1.txt", "archived", "2024-01-05T10:00:00", 100, "/a"),
+            ("/a/2.txt", "archived", "2024-02-01T10:00:00", 50, "/a"),
+            ("/b/3.txt", "archived", "2024-02-09T10:00:00", 25, "/b"),
+            ("/b/4.txt", "restored", None, 7, "/b"),
+        ]
+        for file_path, status, date_archived, size, scan_root in records:
+            record_id = self.db_handler.add_file_record(file_path, status, date_archived)
+            self.db_handler.record_storage_details(record_id, None, size, None, scan_root, None)
+
+        self.assertEqual(self.db_handler.get_bytes_by_status(), [("archived", 3, 175), ("restored", 1, 7)])
+        self.assertEqual(self.db_handler.get_bytes_by_scan_root(), [("/a", 2, 150), ("/b", 1, 25)])
+        self.assertEqual(self.db_handler.get_bytes_by_archive_month(), [("2024-01", 1, 100), ("2024-02", 2, 75)])
+
+    def test_space_reports_use_covering_indexes(self):
+        """Test that the reporting queries are answered from covering indexes without touching the table."""
+        queries = [
+            "SELECT status, COUNT(*), COALESCE(SUM(original_size), 0) FROM archive GROUP BY status ORDER BY status",
+            "SELECT scan_root, COUNT(*), COALESCE(SUM(original_size), 0) FROM archive WHERE status = 'archived' "
+            "GROUP BY scan_root ORDER BY scan_root",
+            "SELECT substr(date_archived, 1, 7), COUNT(*), COALESCE(SUM(original_size), 0) FROM archive "
+            "WHERE status = 'archived' GROUP BY substr(date_archived, 1, 7) ORDER BY substr(date_archived, 1, 7)",
+        ]
+        for query in queries:
+            plan = " ".join(row[3] for row in self.db_handler.cursor.execute("EXPLAIN QUERY PLAN " + query))
+            self.assertIn("COVERING INDEX", plan, query)
+            self.assertNotIn("TEMP B-TREE", plan, query)
+
 if __name__ == '__main__':
     unittest.main()
@@ -5,6 +5,8 @@ import shutil
 from unittest.mock import MagicMock, patch
 from datetime import datetime, timedelta
 from src import file_handler as fh
+from src.database import DatabaseHandler
+from src import integrity
 
 class TestFileHandler(unittest.TestCase):
 
@@ -82,6 +84,188 @@ class TestFileHandler(unittest.TestCase):
         mock_utime.assert_called_once_with(original_path, None)
         self.mock_db_handler.update_file_status.assert_called_with(1, 'restored')
 
+    def test_purge_uses_stored_path(self):
+        """Test that purging deletes the file at the recorded stored path."""
+        stored_dir = os.path.join(self.archive_dir, 'nested')
+        os.makedirs(stored_dir)
+        stored_path = os.path.join(stored_dir, 'old.txt')
+        with open(stored_path, "w") as f:
+            f.write("purge me")
+        archived_on = (datetime.now() - timedelta(days=10)).isoformat()
+
+        self.mock_db_handler.get_files_by_status.return_value = [
+            (1, os.path.join(self.scan_dir, 'old.txt'), 'archived', archived_on, stored_path, 8, None, self.scan_dir, None)
+        ]
+
+        fh.purge_old_files(self.mock_db_handler, self.mock_config)
+
+        self.assertFalse(os.path.exists(stored_path))
+        self.mock_db_handler.remove_file_record.assert_called_once_with(1)
+
+    def test_sharded_archive_path(self):
+        """Test that the sharded layout nests files under hash-prefixed directories."""
+        config = dict(self.mock_config, archive_layout='sharded', shard_depth=3, shard_width=1)
+        original_path = os.path.join(self.scan_dir, 'report.pdf')
+
+        archive_path = fh.get_archive_path(config, original_path)
+        shards = os.path.relpath(archive_path, self.archive_dir).split(os.sep)
+
+        self.assertEqual(len(shards), 4)
+        self.assertEqual(shards[-1], 'report.pdf')
+        self.assertTrue(all(len(shard) == 1 for shard in shards[:3]))
+        self.assertEqual(archive_path, fh.get_archive_path(config, original_path))
+        self.assertEqual(fh.get_archive_path(self.mock_config, original_path), os.path.join(self.archive_dir, 'report.pdf'))
+
+        with self.assertRaises(ValueError):
+            fh.get_archive_path(dict(config, archive_layout='nested'), original_path)
+
+    def test_reshard_archive_round_trip(self):
+        """Test that an archive can be resharded and flattened again with the database kept in sync."""
+        db_handler = DatabaseHandler(":memory:")
+        db_handler.connect()
+        db_handler.setup_table()
+        try:
+            for name in ("a.txt", "b.txt"):
+                self._create_old_file(name, 35)
+            fh.scan_and_archive_files(db_handler, self.mock_config)
+            self.assertEqual(sorted(os.listdir(self.archive_dir)), ["a.txt", "b.txt"])
+
+            sharded_config = dict(self.mock_config, archive_layout='sharded')
+            self.assertEqual(fh.reshard_archive(db_handler, sharded_config), (2, 0, 0))
+            for record in db_handler.get_files_by_status('archived'):
+                self.assertEqual(record[4], os.path.abspath(fh.get_archive_path(sharded_config, record[1])))
+                self.assertTrue(os.path.exists(record[4]))
+
+            # Re-running is a no-op once everything is in place
+            self.assertEqual(fh.reshard_archive(db_handler, sharded_config), (0, 2, 0))
+
+            self.assertEqual(fh.reshard_archive(db_handler, self.mock_config), (2, 0, 0))
+            self.assertEqual(sorted(os.listdir(self.archive_dir)), ["a.txt", "b.txt"])
+
+            record_id = db_handler.get_files_by_status('archived')[0][0]
+            fh.restore_file(db_handler, self.mock_config, record_id)
+            self.assertEqual(db_handler.get_file_by_id(record_id)[2], 'restored')
+        finally:
+            db_handler.close()
+
+    def test_backfill_storage_details_for_legacy_records(self):
+        """Test that records archived before storage details existed get them from the flat archive once."""
+        db_handler = DatabaseHandler(":memory:")
+        db_handler.connect()
+        db_handler.setup_table()
+        try:
+            present = os.path.join(self.scan_dir, 'legacy.txt')
+            with open(os.path.join(self.archive_dir, 'legacy.txt'), "w") as f:
+                f.write("12345")
+            present_id = db_handler.add_file_record(present, 'archived', datetime.now().isoformat())
+            missing_id = db_handler.add_file_record(os.path.join(self.scan_dir, 'gone.txt'), 'archived', datetime.now().isoformat())
+
+            self.assertEqual(fh.backfill_storage_details(db_handler, self.mock_config), 2)
+
+            record = db_handler.get_file_by_id(present_id)
+            self.assertEqual(record[4], os.path.abspath(os.path.join(self.archive_dir, 'legacy.txt')))
+            self.assertEqual(record[5], 5)
+            self.assertEqual(record[7], self.scan_dir)
+            self.assertIsNone(db_handler.get_file_by_id(missing_id)[5])
+            self.assertEqual(db_handler.get_bytes_by_scan_root(), [(self.scan_dir, 2, 5)])
+
+            # Already backfilled records are not stat'ed again
+            self.assertEqual(fh.backfill_storage_details(db_handler, self.mock_config), 0)
+        finally:
+            db_handler.close()
+
+    def test_lookups_follow_a_file_moved_before_its_path_was_recorded(self):
+        """Test that purge finds a resharded file whose new path isn't recorded, and drops records with no file."""
+        original_path = os.path.join(self.scan_dir, 'moved.txt')
+        sharded_config = dict(self.mock_config, archive_layout='sharded')
+        sharded_path = fh.get_archive_path(sharded_config, original_path)
+        os.makedirs(os.path.dirname(sharded_path))
+        with open(sharded_path, "w") as f:
+            f.write("moved")
+        archived_on = (datetime.now() - timedelta(days=10)).isoformat()
+        stale_path = os.path.join(self.archive_dir, 'moved.txt')
+
+        self.mock_db_handler.get_files_by_status.return_value = [
+            (1, original_path, 'archived', archived_on, stale_path, 5, None, self.scan_dir, None),
+            (2, os.path.join(self.scan_dir, 'lost.txt'), 'archived', archived_on, None, 5, None, self.scan_dir, None),
+        ]
+
+        fh.purge_old_files(self.mock_db_handler, sharded_config)
+
+        self.assertFalse(os.path.exists(sharded_path))
+        self.assertEqual([c.args for c in self.mock_db_handler.remove_file_record.call_args_list], [(1,), (2,)])
+
+    def test_restore_rejects_files_that_are_not_archived(self):
+        """Test that restoring an already restored record doesn't move any archived file over it."""
+        original_path = os.path.join(self.scan_dir, 'report.txt')
+        other_archived = os.path.join(self.archive_dir, 'report.txt')
+        with open(original_path, "w") as f:
+            f.write("live copy")
+        with open(other_archived, "w") as f:
+            f.write("a different file with the same name")
+
+        self.mock_db_handler.get_file_by_id.return_value = (1, original_path, 'restored', None, None)
+
+        self.assertFalse(fh.restore_file(self.mock_db_handler, self.mock_config, 1))
+        with open(original_path) as f:
+            self.assertEqual(f.read(), "live copy")
+        self.assertTrue(os.path.exists(other_archived))
+        self.mock_db_handler.update_file_status.assert_not_called()
+
+    def test_fallback_lookup_ignores_another_records_file(self):
+        """Test that a missing sharded file doesn't resolve to a different record's file with the same name."""
+        db_handler = DatabaseHandler(":memory:")
+        db_handler.connect()
+        db_handler.setup_table()
+        try:
+            sharded_config = dict(self.mock_config, archive_layout='sharded')
+            now = datetime.now().isoformat()
+
+            # Record B is archived flat and still on disk
+            other_stored = os.path.abspath(os.path.join(self.archive_dir, 'report.pdf'))
+            with open(other_stored, "w") as f:
+                f.write("B's report")
+            other_id = db_handler.add_file_record('/y/report.pdf', 'archived', now)
+            db_handler.record_storage_details(other_id, other_stored, 10, None, '/y', None)
+
+            # Record A was archived sharded, but its file is gone
+            lost_path = os.path.join(self.scan_dir, 'report.pdf')
+            lost_id = db_handler.add_file_record(lost_path, 'archived', now)
+            lost_stored = os.path.abspath(fh.get_archive_path(sharded_config, lost_path))
+            db_handler.record_storage_details(lost_id, lost_stored, 10, None, self.scan_dir, None)
+
+            self.assertIsNone(fh.locate_archived_file(db_handler, self.mock_config, lost_id, lost_path, lost_stored, 10))
+            self.assertFalse(fh.restore_file(db_handler, self.mock_config, lost_id))
+            self.assertFalse(os.path.exists(lost_path))
+
+            report = integrity.verify_archive(db_handler, self.mock_config)
+            self.assertEqual([file_id for file_id, _ in report['missing']], [lost_id])
+            self.assertEqual(report['corrupted'], [])
+
+            fh.delete_archived_file(db_handler, self.mock_config, lost_id)
+            self.assertTrue(os.path.exists(other_stored))
+            self.assertEqual(db_handler.get_file_by_id(other_id)[2], 'archived')
+
+            # An unclaimed file with the same name but a different size isn't accepted either
+            db_handler.remove_file_record(other_id)
+            self.assertIsNone(fh.locate_archived_file(db_handler, self.mock_config, lost_id, lost_path, lost_stored, 99))
+        finally:
+            db_handler.close()
+
+    def test_invalid_layout_settings(self):
+        """Test that bad layout settings are reported by validation and don't escape restore."""
+        fh.validate_archive_layout(self.mock_config)
+        for overrides in ({'archive_layout': 'nested'}, {'archive_layout': 'sharded', 'shard_depth': '2'},
+                          {'archive_layout': 'sharded', 'shard_width': 0}):
+            with self.assertRaises(ValueError):
+                fh.validate_archive_layout(dict(self.mock_config, **overrides))
+
+        bad_config = dict(self.mock_config, archive_layout='nested')
+        self.mock_db_handler.get_file_by_id.return_value = (1, os.path.join(self.scan_dir, 'x.txt'), 'archived', 'some_date', '/missing/x.txt')
+        self.assertFalse(fh.restore_file(self.mock_db_handler, bad_config, 1))
+        fh.delete_archived_file(self.mock_db_handler, bad_config, 1)
+        self.mock_db_handler.remove_file_record.assert_not_called()
+
 if __name__ == '__main__':
     unittest.main()
     
\ No newline at end of file
@@ -0,0 +1,145 @@
+import unittest
+import os
+import tempfile
+import shutil
+from unittest.mock import patch
+from datetime import datetime, timedelta
+from src.database import DatabaseHandler
+from src import file_handler as fh
+from src import integrity
+
+class TestIntegrity(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a temporary archive and a real in-memory database."""
+        self.test_dir = tempfile.mkdtemp()
+        self.scan_dir = os.path.join(self.test_dir, 'scan')
+        self.archive_dir = os.path.join(self.test_dir, 'archive')
+        os.makedirs(self.scan_dir)
+
+        self.config = {
+            'scan_directories': [self.scan_dir],
+            'archive_directory': self.archive_dir,
+            'days_until_archive': 3,
+            'days_until_delete': 6,
+            'verify_workers': 2
+        }
+        self.db_handler = DatabaseHandler(":memory:")
+        self.db_handler.connect()
+        self.db_handler.setup_table()
+
+    def tearDown(self):
+        """Close the database and remove the temporary directory."""
+        self.db_handler.close()
+        shutil.rmtree(self.test_dir)
+
+    def _archive_files(self, *names):
+        """Helper that creates old files and archives them through the file handler."""
+        past_date = (datetime.now() - timedelta(days=10)).timestamp()
+        for name in names:
+            file_path = os.path.join(self.scan_dir, name)
+            with open(file_path, "w") as f:
+                f.write(f"content of {name}")
+            os.utime(file_path, (past_date, past_date))
+        fh.scan_and_archive_files(self.db_handler, self.config)
+
+    def test_hash_file_handles_empty_and_large_files(self):
+        """Test that mmap hashing matches hashlib for empty and multi-chunk files."""
+        import hashlib
+        empty_path = os.path.join(self.test_dir, 'empty.bin')
+        open(empty_path, 'wb').close()
+        large_path = os.path.join(self.test_dir, 'large.bin')
+        data = os.urandom(fh.HASH_CHUNK_SIZE * 2 + 123)
+        with open(large_path, 'wb') as f:
+            f.write(data)
+
+        self.assertEqual(fh.hash_file(empty_path), hashlib.sha256(b'').hexdigest())
+        self.assertEqual(fh.hash_file(large_path), hashlib.sha256(data).hexdigest())
+
+    def test_archiving_records_checksum(self):
+        """Test that archived files get a checksum that a fresh verification accepts."""
+        self._archive_files("a.txt", "b.txt")
+
+        records = self.db_handler.get_archived_integrity()
+        self.assertEqual(len(records), 2)
+        self.assertTrue(all(record[3] for record in records))
+
+        report = integrity.verify_archive(self.db_handler, self.config)
+        self.assertEqual(report['skipped'], 2)
+        self.assertEqual(report['corrupted'], [])
+
+        report = integrity.verify_archive(self.db_handler, self.config, full=True)
+        self.assertEqual(report['verified'], 2)
+        self.assertEqual(report['corrupted'], [])
+
+    def test_detects_corrupted_missing_and_orphaned_files(self):
+        """Test that modified, deleted and untracked archive files are all reported."""
+        self._archive_files("good.txt", "bad.txt", "gone.txt")
+        with open(os.path.join(self.archive_dir, "bad.txt"), "w") as f:
+            f.write("tampered")
+        os.remove(os.path.join(self.archive_dir, "gone.txt"))
+        orphan_path = os.path.join(self.archive_dir, "stray.txt")
+        with open(orphan_path, "w") as f:
+            f.write("no record")
+
+        report = integrity.verify_archive(self.db_handler, self.config)
+
+        self.assertEqual(report['skipped'], 1)
+        self.assertEqual([path for _, path in report['corrupted']], [os.path.join(self.archive_dir, "bad.txt")])
+        self.assertEqual([path for _, path in report['missing']], [os.path.join(self.archive_dir, "gone.txt")])
+        self.assertEqual(report['orphaned'], [os.path.abspath(orphan_path)])
+
+    def test_stat_errors_do_not_abort_verification(self):
+        """Test that a path blocked by a file, or an unreadable file, is reported instead of raising."""
+        self._archive_files("a.txt", "b.txt")
+        records = self.db_handler.get_archived_integrity()
+        # A shard directory replaced by a plain file
+        os.remove(records[0][2])
+        with open(os.path.join(self.archive_dir, "ab"), "w") as f:
+            f.write("not a directory")
+        blocked_path = os.path.join(self.archive_dir, "ab", "a.txt")
+        self.db_handler.update_stored_paths([(records[0][0], blocked_path)])
+
+        original_stat = os.stat
+        denied_path = records[1][2]
+        def fake_stat(path, *args, **kwargs):
+            if path == denied_path:
+                raise PermissionError(13, "Permission denied", path)
+            return original_stat(path, *args, **kwargs)
+
+        with patch('src.integrity.os.stat', side_effect=fake_stat):
+            report = integrity.verify_archive(self.db_handler, self.config)
+
+        self.assertEqual(report['missing'], [(records[0][0], blocked_path)])
+        self.assertEqual(report['unreadable'], [(records[1][0], denied_path)])
+
+    def test_hash_failure_still_records_archived_file(self):
+        """Test that a file that can't be hashed after moving is still recorded, and baselined later."""
+        with patch('src.file_handler.hash_file', side_effect=OSError(5, "Input/output error")):
+            self._archive_files("flaky.txt")
+
+        archived = self.db_handler.get_files_by_status('archived')
+        self.assertEqual(len(archived), 1)
+        self.assertEqual(archived[0][4], os.path.abspath(os.path.join(self.archive_dir, "flaky.txt")))
+        self.assertIsNone(self.db_handler.get_archived_integrity()[0][3])
+
+        report = integrity.verify_archive(self.db_handler, self.config)
+        self.assertEqual(report['baselined'], 1)
+        self.assertEqual(report['orphaned'], [])
+
+    def test_baselines_files_without_checksum(self):
+        """Test that files archived before checksums existed get a baseline recorded."""
+        os.makedirs(self.archive_dir)
+        original_path = os.path.join(self.scan_dir, "legacy.txt")
+        with open(os.path.join(self.archive_dir, "legacy.txt"), "w") as f:
+            f.write("legacy")
+        self.db_handler.add_file_record(original_path, 'archived', datetime.now().isoformat())
+
+        report = integrity.verify_archive(self.db_handler, self.config)
+        self.assertEqual(report['baselined'], 1)
+
+        report = integrity.verify_archive(self.db_handler, self.config)
+        self.assertEqual(report['skipped'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -61,5 +61,16 @@ class TestMain(unittest.TestCase):
         # Check that the connection was closed at the end
         mock_db_instance.close.assert_called_once()
 
+    @patch('main.load_config')
+    @patch('main.logger.setup_logger')
+    @patch('main.DatabaseHandler')
+    def test_main_rejects_invalid_layout(self, mock_db_handler, mock_logger, mock_load_config):
+        """Test that an invalid archive layout stops the application before it connects."""
+        mock_load_config.return_value = dict(self.config_data, archive_layout='nested')
+
+        main()
+
+        mock_db_handler.assert_not_called()
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,122 @@
+import unittest
+import os
+import tempfile
+import shutil
+from datetime import datetime, timedelta
+from src.database import DatabaseHandler
+from src import planner
+
+class TestPlanner(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a temporary scan directory and a real in-memory database."""
+        self.test_dir = tempfile.mkdtemp()
+        self.scan_dir = os.path.join(self.test_dir, 'scan')
+        self.archive_dir = os.path.join(self.test_dir, 'archive')
+        os.makedirs(self.scan_dir)
+
+        self.config = {
+            'scan_directories': [self.scan_dir],
+            'archive_directory': self.archive_dir,
+            'days_until_archive': 3,
+            'days_until_delete': 6
+        }
+        self.db_handler = DatabaseHandler(":memory:")
+        self.db_handler.connect()
+        self.db_handler.setup_table()
+
+    def tearDown(self):
+        """Close the database and remove the temporary directory."""
+        self.db_handler.close()
+        shutil.rmtree(self.test_dir)
+
+    def _create_old_file(self, filename, size, days_old=10):
+        """Helper function to create a file of a given size with a past modification time."""
+        file_path = os.path.join(self.scan_dir, filename)
+        with open(file_path, "wb") as f:
+            f.write(b"x" * size)
+        past_date = (datetime.now() - timedelta(days=days_old)).timestamp()
+        os.utime(file_path, (past_date, past_date))
+        return file_path
+
+    def test_plan_archive_changes_nothing(self):
+        """Test that planning reports counts and bytes without moving files or writing records."""
+        first = self._create_old_file("a.txt", 10)
+        self._create_old_file("b.txt", 30)
+        self._create_old_file("recent.txt", 5, days_old=0)
+
+        plan = planner.plan_archive(self.db_handler, self.config)
+
+        self.assertEqual(plan['summary']['files'], 2)
+        self.assertEqual(plan['summary']['bytes'], 40)
+        self.assertEqual(plan['summary']['same_device_files'], 2)
+        self.assertEqual(plan['summary']['unestimated_files'], 2)
+        self.assertTrue(os.path.exists(first))
+        self.assertFalse(os.path.exists(self.archive_dir))
+        self.assertEqual(self.db_handler.get_files_by_status('archived'), [])
+
+    def test_execute_archive_plan_and_estimate_from_throughput(self):
+        """Test executing an approved plan, skipping changed files, and estimating the next run."""
+        self._create_old_file("a.txt", 10)
+        changed = self._create_old_file("b.txt", 30)
+        plan = planner.plan_archive(self.db_handler, self.config)
+        with open(changed, "ab") as f:
+            f.write(b"more")
+
+        skipped = planner.execute_archive_plan(self.db_handler, self.config, plan)
+
+        self.assertEqual(skipped, 1)
+        archived = self.db_handler.get_files_by_status('archived')
+        self.assertEqual([os.path.basename(record[1]) for record in archived], ["a.txt"])
+        throughput = self.db_handler.get_throughput()
+        self.assertEqual(throughput['move_same_device'][:2], (1, 10))
+        self.assertEqual(throughput['hash'][:2], (1, 10))
+
+        self._create_old_file("c.txt", 20)
+        plan = planner.plan_archive(self.db_handler, self.config)
+        self.assertEqual(plan['summary']['unestimated_files'], 0)
+        self.assertGreater(plan['summary']['estimated_seconds'], 0)
+
+    def test_estimate_scales_hashing_with_bytes(self):
+        """Test that history from many small files doesn't under-estimate a plan of a few large files."""
+        # 1000 files of 1 KiB: 0.1s of moving, 0.05s of hashing
+        self.db_handler.record_throughput('move_same_device', 1000, 1000 * 1024, 0.1)
+        self.db_handler.record_throughput('hash', 1000, 1000 * 1024, 0.05)
+        large_size = 4 * 1024 * 1024
+        self._create_old_file("large1.bin", large_size)
+        self._create_old_file("large2.bin", large_size)
+
+        plan = planner.plan_archive(self.db_handler, self.config)
+
+        per_file_moves = 2 * 0.1 / 1000
+        hashing = 2 * large_size * 0.05 / (1000 * 1024)
+        self.assertAlmostEqual(plan['summary']['estimated_seconds'], per_file_moves + hashing)
+        self.assertGreater(plan['summary']['estimated_seconds'], 100 * 2 * (0.15 / 1000))
+
+    def test_plan_and_execute_purge(self):
+        """Test that purge plans use database sizes and skip records restored in the meantime."""
+        old_date = (datetime.now() - timedelta(days=10)).isoformat()
+        kept_id = self.db_handler.add_file_record("/scan/keep.txt", 'archived', datetime.now().isoformat())
+        purge_id = self.db_handler.add_file_record("/scan/purge.txt", 'archived', old_date)
+        restored_id = self.db_handler.add_file_record("/scan/restored.txt", 'archived', old_date)
+        self.db_handler.record_storage_details(purge_id, None, 64, None, "/scan", None)
+        os.makedirs(self.archive_dir)
+        for name in ("purge.txt", "restored.txt"):
+            with open(os.path.join(self.archive_dir, name), "w") as f:
+                f.write("archived")
+
+        plan = planner.plan_purge(self.db_handler, self.config)
+        self.assertEqual([action['file_id'] for action in plan['actions']], [purge_id, restored_id])
+        self.assertEqual(plan['summary']['bytes'], 64)
+
+        self.db_handler.update_file_status(restored_id, 'restored')
+        skipped = planner.execute_purge_plan(self.db_handler, self.config, plan)
+
+        self.assertEqual(skipped, 1)
+        self.assertIsNone(self.db_handler.get_file_by_id(purge_id))
+        self.assertFalse(os.path.exists(os.path.join(self.archive_dir, "purge.txt")))
+        self.assertIsNotNone(self.db_handler.get_file_by_id(kept_id))
+        self.assertIsNotNone(self.db_handler.get_file_by_id(restored_id))
+
+if __name__ == '__main__':
+    unittest.main()
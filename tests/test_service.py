@@ -0,0 +1,203 @@
+import unittest
+from unittest.mock import patch
+import os
+import json
+import asyncio
+import tempfile
+import shutil
+from datetime import datetime
+from src.database import DatabaseHandler
+from src.service import ArchiveService
+import src.file_handler as fh
+
+class TestArchiveService(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        """Create a database with one archived file and start the service."""
+        self.test_dir = tempfile.mkdtemp()
+        self.archive_dir = os.path.join(self.test_dir, 'archive')
+        self.original_path = os.path.join(self.test_dir, 'scan', 'report.pdf')
+        os.makedirs(self.archive_dir)
+        with open(os.path.join(self.archive_dir, 'report.pdf'), 'w') as f:
+            f.write("archived")
+
+        self.config = {
+            'database_name': os.path.join(self.test_dir, 'test.db'),
+            'archive_directory': self.archive_dir,
+            'service_socket': os.path.join(self.test_dir, 'test.sock'),
+        }
+        db_handler = DatabaseHandler(self.config['database_name'])
+        db_handler.connect()
+        db_handler.setup_table()
+        self.file_id = db_handler.add_file_record(self.original_path, 'archived', datetime.now().isoformat())
+        db_handler.add_file_record(os.path.join(self.test_dir, 'scan', 'notes_100%.txt'), 'active')
+        db_handler.close()
+
+        self.service = ArchiveService(self.config, read_connections=2)
+        await self.service.start()
+        self.reader, self.writer = await asyncio.open_unix_connection(self.config['service_socket'])
+
+    async def asyncTearDown(self):
+        """Disconnect, stop the service and remove the temporary directory."""
+        self.writer.close()
+        await self.service.close()
+        shutil.rmtree(self.test_dir)
+
+    async def _request(self, request):
+        """Helper that sends one request and returns the decoded response."""
+        self.writer.write(json.dumps(request).encode() + b'\n')
+        await self.writer.drain()
+        return json.loads(await self.reader.readline())
+
+    async def test_list_search_and_status(self):
+        """Test the read-only lookups."""
+        response = await self._request({'action': 'list'})
+        self.assertTrue(response['ok'])
+        self.assertEqual([record['file_path'] for record in response['result']], [self.original_path])
+
+        response = await self._request({'action': 'search', 'pattern': '100%'})
+        self.assertEqual(len(response['result']), 1)
+        self.assertEqual(response['result'][0]['status'], 'active')
+
+        response = await self._request({'action': 'status', 'path': self.original_path})
+        self.assertEqual(response['result']['id'], self.file_id)
+        response = await self._request({'action': 'status', 'path': '/not/tracked'})
+        self.assertIsNone(response['result'])
+
+    async def test_list_pages(self):
+        """Test that list returns at most `limit` records and continues after `after_id`."""
+        db_handler = DatabaseHandler(self.config['database_name'])
+        db_handler.connect()
+        for i in range(4):
+            db_handler.add_file_record(os.path.join(self.test_dir, 'scan', f'page_{i}.txt'), 'archived')
+        db_handler.close()
+
+        response = await self._request({'action': 'list', 'limit': 2})
+        first_page = [record['id'] for record in response['result']]
+        self.assertEqual(len(first_page), 2)
+        response = await self._request({'action': 'list', 'limit': 2, 'after_id': first_page[-1]})
+        second_page = [record['id'] for record in response['result']]
+        response = await self._request({'action': 'list', 'limit': 2, 'after_id': second_page[-1]})
+        third_page = [record['id'] for record in response['result']]
+
+        self.assertEqual(len(second_page), 2)
+        self.assertEqual(len(third_page), 1)
+        self.assertEqual(first_page + second_page + third_page, sorted(set(first_page + second_page + third_page)))
+
+    async def test_status_of_file_archived_from_relative_directory(self):
+        """Test that a file archived from a relative scan directory can be looked up by its absolute path."""
+        os.makedirs(os.path.join(self.test_dir, 'docs'))
+        old_file = os.path.join(self.test_dir, 'docs', 'old.txt')
+        with open(old_file, 'w') as f:
+            f.write("old")
+        os.utime(old_file, (0, 0))
+
+        cwd = os.getcwd()
+        os.chdir(self.test_dir)
+        self.addCleanup(os.chdir, cwd)
+        config = dict(self.config, scan_directories=['./docs'], days_until_archive=1)
+        db_handler = DatabaseHandler(self.config['database_name'])
+        db_handler.connect()
+        fh.scan_and_archive_files(db_handler, config)
+        db_handler.close()
+
+        response = await self._request({'action': 'status', 'path': os.path.realpath(old_file)})
+        self.assertEqual(response['result']['status'], 'archived')
+        response = await self._request({'action': 'status', 'path': './docs/old.txt'})
+        self.assertEqual(response['result']['file_path'], os.path.abspath('docs/old.txt'))
+
+    async def test_concurrent_clients(self):
+        """Test that many clients are answered concurrently through the read pool."""
+        async def lookup():
+            reader, writer = await asyncio.open_unix_connection(self.config['service_socket'])
+            writer.write(json.dumps({'action': 'status', 'id': self.file_id}).encode() + b'\n')
+            await writer.drain()
+            response = json.loads(await reader.readline())
+            writer.close()
+            return response
+
+        responses = await asyncio.gather(*(lookup() for _ in range(20)))
+        self.assertTrue(all(response['result']['status'] == 'archived' for response in responses))
+
+    async def test_restore_runs_in_background(self):
+        """Test that a restore returns a task that finishes after the file is moved back."""
+        response = await self._request({'action': 'restore', 'id': self.file_id})
+        task_id = response['result']['task_id']
+
+        for _ in range(100):
+            response = await self._request({'action': 'task', 'task_id': task_id})
+            if response['result']['state'] != 'running':
+                break
+            await asyncio.sleep(0.01)
+
+        self.assertEqual(response['result']['state'], 'done')
+        self.assertTrue(os.path.exists(self.original_path))
+        response = await self._request({'action': 'status', 'id': self.file_id})
+        self.assertEqual(response['result']['status'], 'restored')
+
+    async def test_restore_twice_is_rejected(self):
+        """Test that a file which was already restored can't be restored again."""
+        response = await self._request({'action': 'restore', 'id': self.file_id})
+        task_id = response['result']['task_id']
+        await asyncio.gather(*self.service._background)
+        self.assertEqual(self.service.tasks[task_id]['state'], 'done')
+        with open(self.original_path, 'w') as f:
+            f.write("edited after restore")
+
+        response = await self._request({'action': 'restore', 'id': self.file_id})
+
+        self.assertFalse(response['ok'])
+        self.assertIn('not archived', response['error'])
+        with open(self.original_path) as f:
+            self.assertEqual(f.read(), "edited after restore")
+        response = await self._request({'action': 'restore', 'id': 999})
+        self.assertFalse(response['ok'])
+
+    async def test_bad_requests(self):
+        """Test that invalid requests get an error response without closing the connection."""
+        response = await self._request({'action': 'explode'})
+        self.assertFalse(response['ok'])
+        self.writer.write(b'not json\n')
+        await self.writer.drain()
+        self.assertFalse(json.loads(await self.reader.readline())['ok'])
+        response = await self._request({'action': 'task', 'task_id': 999})
+        self.assertFalse(response['ok'])
+
+    async def test_finished_tasks_are_evicted(self):
+        """Test that finished tasks are forgotten after the TTL and beyond the size cap."""
+        self.service.task_ttl = 0
+        response = await self._request({'action': 'restore', 'id': self.file_id})
+        task_id = response['result']['task_id']
+        await asyncio.gather(*self.service._background)
+
+        self.service._evict_finished_tasks()
+        self.assertNotIn(task_id, self.service.tasks)
+        response = await self._request({'action': 'task', 'task_id': task_id})
+        self.assertFalse(response['ok'])
+
+        self.service.task_ttl = 3600
+        now = asyncio.get_running_loop().time()
+        for task_id in range(100, 105):
+            self.service.tasks[task_id] = {'task_id': task_id, 'state': 'done'}
+            self.service._finished_at[task_id] = now
+        with patch('src.service.MAX_FINISHED_TASKS', 3):
+            self.service._evict_finished_tasks()
+        self.assertEqual(sorted(self.service.tasks), [102, 103, 104])
+
+    async def test_oversized_request_line(self):
+        """Test that a line longer than the stream limit gets an error response instead of crashing the handler."""
+        self.writer.write(b'x' * (128 * 1024) + b'\n')
+        await self.writer.drain()
+        response = json.loads(await self.reader.readline())
+        self.assertFalse(response['ok'])
+        self.assertIn('too long', response['error'])
+
+        # The service keeps serving other clients
+        reader, writer = await asyncio.open_unix_connection(self.config['service_socket'])
+        writer.write(json.dumps({'action': 'status', 'id': self.file_id}).encode() + b'\n')
+        await writer.drain()
+        self.assertTrue(json.loads(await reader.readline())['ok'])
+        writer.close()
+
+if __name__ == '__main__':
+    unittest.main()